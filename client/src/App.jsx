@@ -16,6 +16,14 @@ const Chatbot = () => {
   const [error, setError] = useState(null);
   const messagesEndRef = useRef(null);
   const inputRef = useRef(null);
+  const sessionIdRef = useRef(null);
+  if (sessionIdRef.current === null) {
+    // crypto.randomUUID is only available in secure (https) contexts
+    sessionIdRef.current =
+      typeof crypto !== "undefined" && crypto.randomUUID
+        ? crypto.randomUUID()
+        : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+  }
 
   const API_BASE_URL = "https://kit-noninitial-unusably.ngrok-free.dev";
 
@@ -43,6 +51,7 @@ const Chatbot = () => {
         body: JSON.stringify({
           content: message,
           role: "user",
+          session_id: sessionIdRef.current,
         }),
       });
 
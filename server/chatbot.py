@@ -4,102 +4,442 @@ Scrapes agiteks.com and answers queries based on that data
 
 Prerequisites:
 pip install langchain langchain-groq langchain-community python-dotenv
-pip install faiss-cpu beautifulsoup4 requests
-pip install langchain-huggingface sentence-transformers
+pip install faiss-cpu pyarrow beautifulsoup4 lxml aiohttp
+pip install sentence-transformers
+pip install onnxruntime tokenizers "semchunk>=3.0"
+
+Optional ONNX Runtime query encoder (used automatically when present):
+optimum-cli export onnx --model sentence-transformers/all-MiniLM-L6-v2 onnx_minilm/
+pip install onnx  # only needed for quantize_onnx_model
+python -c "from chatbot import quantize_onnx_model; quantize_onnx_model()"
 """
 
 import os
+import json
+import math
+import hashlib
+import uuid
 import pickle
-import requests
+import asyncio
+import aiohttp
+from collections import deque
+import faiss
+import numpy as np
+import pyarrow as pa
+import torch
+import onnxruntime as ort
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urljoin, urldefrag, urlparse, urlsplit, urlunsplit, parse_qsl, urlencode
 from dotenv import load_dotenv
 
 from langchain_groq import ChatGroq
-from langchain.schema import HumanMessage, AIMessage, SystemMessage
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
+from langchain.schema import HumanMessage, AIMessage, SystemMessage, Document
+from sentence_transformers import SentenceTransformer
+from tokenizers import Tokenizer
+from semchunk import chunkerify
+from langchain_core.embeddings import Embeddings
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
 
 load_dotenv()
 
 # Configuration
 WEBSITE_URL = "https://agiteks.com"
 FAISS_INDEX_PATH = "faiss_index"
+PAGE_HASHES_PATH = os.path.join(FAISS_INDEX_PATH, "page_hashes.json")
+EMBEDDINGS_PATH = os.path.join(FAISS_INDEX_PATH, "embeddings.npy")
+DOCSTORE_FILE = "docs.arrow"
 MAX_PAGES_TO_SCRAPE = 20
+MAX_CONCURRENT_REQUESTS = 8
+
+# Query parameters that never change page content
+TRACKING_PARAMS = {"gclid", "fbclid", "msclkid"}
+
+# Page boilerplate removed before extracting text and links
+BOILERPLATE_TAGS = ["script", "style", "noscript", "nav", "footer", "header"]
+
+# Embedding model configuration
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+EMBEDDING_BATCH_SIZE = 128 if EMBEDDING_DEVICE == "cuda" else 64
+EMBEDDING_MAX_LENGTH = 256
+CHUNK_SIZE_TOKENS = EMBEDDING_MAX_LENGTH - 2  # room for [CLS] and [SEP]
+CHUNK_OVERLAP_TOKENS = 50  # ~20%, like the previous 200/1000 character overlap
+PARALLEL_CHUNKING_MIN_DOCS = 200  # below this a process pool costs more than it saves
+# Split the cores between uvicorn workers (WEB_CONCURRENCY) so several
+# workers do not oversubscribe the CPU; TORCH_THREADS overrides this
+INFERENCE_THREADS = int(os.getenv(
+    "TORCH_THREADS",
+    max(1, os.cpu_count() // int(os.getenv("WEB_CONCURRENCY", 1)))
+))
+ONNX_MODEL_DIR = "onnx_minilm"
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_INT8_MODEL_FILE = "model.int8.onnx"
+
+# FAISS index configuration
+FAISS_INDEX_TYPE = "hnsw_sq"  # "hnsw_sq" or "ivf_pq"
+HNSW_M = 32
+HNSW_EF_SEARCH = 64
+PQ_SUBQUANTIZERS = 16  # 16 sub-quantizers x 8 bits = 16 bytes per vector
+PQ_BITS = 8
+IVF_NPROBE = 8
+
+def build_faiss_index(vectors):
+    """Build a compressed FAISS index over a float32 embedding matrix"""
+    num_vectors, dim = vectors.shape
+    
+    if FAISS_INDEX_TYPE == "hnsw_sq":
+        # HNSW graph over int8 scalar-quantized vectors (1 byte per dimension)
+        index = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_8bit, HNSW_M)
+    elif num_vectors < 2 ** PQ_BITS:
+        # PQ codebooks need at least 2**PQ_BITS training points, so very
+        # small corpora fall back to an exhaustive flat index
+        index = faiss.IndexFlatL2(dim)
+    else:
+        nlist = max(1, int(math.sqrt(num_vectors)))
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, PQ_SUBQUANTIZERS, PQ_BITS)
+    
+    index.train(vectors)
+    index.add(vectors)
+    configure_search_params(index)
+    return index
+
+def reconstruct_vectors(index):
+    """Decode every stored vector of a FAISS index into a float32 matrix"""
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+def read_faiss_index(path, mmap=True):
+    """Read a saved FAISS index, memory-mapping IVF inverted lists if requested"""
+    # faiss only honours IO_FLAG_MMAP for IVF inverted lists (FAISS_INDEX_TYPE
+    # "ivf_pq"); HNSW-SQ and flat indexes are always read fully into memory
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+    return faiss.read_index(os.path.join(path, "index.faiss"), flags)
+
+class ArrowDocstore(Docstore):
+    """Read-only docstore backed by a memory-mapped Arrow IPC file"""
+    
+    def __init__(self, path):
+        # Uncompressed Arrow IPC maps zero-copy, so the text columns stay in
+        # the shared page cache instead of becoming Python objects up front
+        self.table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        self.ids = self.table.column('id').to_pylist()
+        self.id_to_row = {doc_id: row for row, doc_id in enumerate(self.ids)}
+    
+    def search(self, search):
+        row = self.id_to_row.get(search)
+        if row is None:
+            return f"ID {search} not found."
+        return Document(
+            page_content=self.table.column('text')[row].as_py(),
+            metadata={'source': self.table.column('source')[row].as_py()}
+        )
+
+def save_vectorstore(vectorstore, path=FAISS_INDEX_PATH):
+    """Save the FAISS index and its documents as an Arrow table"""
+    os.makedirs(path, exist_ok=True)
+    
+    # Both files are written then renamed, so processes still mapping the
+    # old files never read a partially written one
+    index_path = os.path.join(path, "index.faiss")
+    faiss.write_index(vectorstore.index, index_path + ".tmp")
+    os.replace(index_path + ".tmp", index_path)
+    
+    # Rows are stored in index order, so row i belongs to vector i
+    ids = [vectorstore.index_to_docstore_id[i] for i in range(vectorstore.index.ntotal)]
+    docs = [vectorstore.docstore.search(doc_id) for doc_id in ids]
+    table = pa.table({
+        'id': ids,
+        'text': [doc.page_content for doc in docs],
+        'source': [doc.metadata.get('source', 'Unknown') for doc in docs]
+    })
+    docstore_path = os.path.join(path, DOCSTORE_FILE)
+    with pa.OSFile(docstore_path + ".tmp", 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(docstore_path + ".tmp", docstore_path)
+
+def load_vectorstore(embeddings, path=FAISS_INDEX_PATH, mmap=True):
+    """Load a saved vectorstore, memory-mapping the documents and (IVF only) the index"""
+    index = read_faiss_index(path, mmap=mmap)
+    configure_search_params(index)
+    
+    docstore_path = os.path.join(path, DOCSTORE_FILE)
+    if os.path.exists(docstore_path):
+        docstore = ArrowDocstore(docstore_path)
+        index_to_docstore_id = dict(enumerate(docstore.ids))
+    else:
+        # Indexes saved by FAISS.save_local keep a pickled docstore
+        with open(os.path.join(path, "index.pkl"), 'rb') as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+    
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id
+    )
+
+def load_page_hashes():
+    """Load per-URL content hashes recorded at the last index build"""
+    if not os.path.exists(PAGE_HASHES_PATH):
+        return {}
+    with open(PAGE_HASHES_PATH) as f:
+        return json.load(f)
+
+def save_page_hashes(page_hashes):
+    """Persist per-URL content hashes next to the FAISS index"""
+    with open(PAGE_HASHES_PATH, 'w') as f:
+        json.dump(page_hashes, f, indent=2)
+
+def configure_search_params(index):
+    """Apply search-time parameters to a (loaded) FAISS index"""
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = IVF_NPROBE
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+
+class OnnxEmbeddings(Embeddings):
+    """MiniLM sentence embeddings computed with ONNX Runtime"""
+    
+    def __init__(self, model_dir=ONNX_MODEL_DIR, model_file=ONNX_MODEL_FILE):
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = INFERENCE_THREADS
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=EMBEDDING_MAX_LENGTH)
+        self.tokenizer.enable_padding()
+    
+    def _encode(self, texts):
+        """Mean-pool token embeddings and L2-normalize them"""
+        encodings = self.tokenizer.encode_batch(texts)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        inputs = {
+            'input_ids': np.array([e.ids for e in encodings], dtype=np.int64),
+            'attention_mask': attention_mask
+        }
+        if 'token_type_ids' in self.input_names:
+            inputs['token_type_ids'] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        
+        token_embeddings = self.session.run(None, inputs)[0]
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return (pooled / norms).astype(np.float32)
+    
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        return self._encode(texts).tolist()
+    
+    def embed_query(self, text):
+        return self._encode([text])[0].tolist()
+
+class SentenceTransformerEmbeddings(Embeddings):
+    """LangChain embeddings over an already-loaded SentenceTransformer"""
+    
+    def __init__(self, model):
+        self.model = model
+    
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        vectors = self.model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+        return vectors.astype(np.float32).tolist()
+    
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+def quantize_onnx_model(sample_texts=None):
+    """Quantize the exported ONNX model to int8 weights and check recall"""
+    # Imported here because onnxruntime.quantization needs the optional onnx package
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    
+    quantize_dynamic(
+        os.path.join(ONNX_MODEL_DIR, ONNX_MODEL_FILE),
+        os.path.join(ONNX_MODEL_DIR, ONNX_INT8_MODEL_FILE),
+        weight_type=QuantType.QInt8
+    )
+    print(f"Saved int8 model to {os.path.join(ONNX_MODEL_DIR, ONNX_INT8_MODEL_FILE)}")
+    
+    # Both models return unit vectors, so the row-wise dot product is the
+    # cosine similarity between the fp32 and int8 embeddings
+    sample_texts = sample_texts or [
+        "What services does Agiteks offer?",
+        "How can I contact the Agiteks team?",
+        "Tell me about your software development process."
+    ]
+    fp32 = OnnxEmbeddings(model_file=ONNX_MODEL_FILE)._encode(sample_texts)
+    int8 = OnnxEmbeddings(model_file=ONNX_INT8_MODEL_FILE)._encode(sample_texts)
+    similarities = (fp32 * int8).sum(axis=1)
+    print(f"fp32 vs int8 cosine similarity: mean={similarities.mean():.4f}, min={similarities.min():.4f}")
+    return similarities
+
+def select_query_dtype():
+    """Pick a reduced-precision dtype for the PyTorch query encoder"""
+    if torch.cuda.is_available():
+        return torch.float16
+    
+    # bfloat16 only pays off on CPUs with native AVX512_BF16 support
+    try:
+        with open("/proc/cpuinfo") as f:
+            if "avx512_bf16" in f.read():
+                return torch.bfloat16
+    except OSError:
+        pass
+    return torch.float32
+
+def load_query_embeddings():
+    """Return the query-only encoder: ONNX if exported, else the PyTorch model"""
+    for model_file in (ONNX_INT8_MODEL_FILE, ONNX_MODEL_FILE):
+        if os.path.exists(os.path.join(ONNX_MODEL_DIR, model_file)):
+            print(f"Using ONNX Runtime embeddings from {ONNX_MODEL_DIR}/{model_file}")
+            return OnnxEmbeddings(model_file=model_file)
+    
+    # This model only encodes queries, so it may run in reduced precision;
+    # query vectors are upcast to float32 for the search. Document chunks
+    # are encoded by RAGSystem.model, which is always float32.
+    model = SentenceTransformer(
+        EMBEDDING_MODEL_NAME,
+        device=EMBEDDING_DEVICE,
+        model_kwargs={'torch_dtype': select_query_dtype()}
+    )
+    return SentenceTransformerEmbeddings(model)
 
 class WebsiteScraper:
     """Scrapes website content"""
     
-    def __init__(self, base_url, max_pages=20):
+    def __init__(self, base_url, max_pages=20, max_concurrency=MAX_CONCURRENT_REQUESTS, known_hashes=None):
         self.base_url = base_url
         self.max_pages = max_pages
+        self.max_concurrency = max_concurrency
+        self.known_hashes = known_hashes or {}
+        self.page_hashes = {}
         self.visited_urls = set()
-        self.domain = urlparse(base_url).netloc
+        self.domain = urlparse(base_url).netloc.lower()
+    
+    @staticmethod
+    def _normalize(url):
+        """Canonicalize a URL into a dedup key (never fetched or used as a link base)"""
+        parts = urlsplit(url)
+        query = urlencode(sorted(
+            (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+            if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMS
+        ))
+        path = parts.path.rstrip('/')
+        # Drop the fragment, which never reaches the server
+        return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, query, ''))
     
     def is_valid_url(self, url):
         """Check if URL belongs to the same domain"""
         parsed = urlparse(url)
-        return parsed.netloc == self.domain
+        return parsed.netloc.lower() == self.domain
     
-    def scrape_page(self, url):
+    def parse_page(self, url, content):
+        """Extract text and crawlable links from a page's HTML"""
+        soup = BeautifulSoup(content, 'lxml')
+        
+        # Remove scripts, styles and navigation/footer boilerplate together
+        # with everything nested inside them
+        for script in soup(BOILERPLATE_TAGS):
+            script.decompose()
+        
+        # Get text content
+        text = soup.get_text(separator=' ', strip=True)
+        
+        # Get all links for crawling
+        links = []
+        for link in soup.find_all('a', href=True):
+            absolute_url, _ = urldefrag(urljoin(url, link['href']))
+            if self.is_valid_url(absolute_url) and self._normalize(absolute_url) not in self.visited_urls:
+                links.append(absolute_url)
+        
+        return text, links
+    
+    async def scrape_page(self, session, semaphore, url):
         """Scrape content from a single page"""
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.get(url, timeout=10, headers=headers)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Remove script and style elements
-            for script in soup(["script", "style", "nav", "footer", "header"]):
-                script.decompose()
+            async with semaphore:
+                async with session.get(url) as response:
+                    response.raise_for_status()
+                    content = await response.read()
+                    # Resolve links against the final URL, after any redirects
+                    final_url = str(response.url)
             
-            # Get text content
-            text = soup.get_text(separator=' ', strip=True)
-            
-            # Get all links for crawling
-            links = []
-            for link in soup.find_all('a', href=True):
-                absolute_url = urljoin(url, link['href'])
-                if self.is_valid_url(absolute_url) and absolute_url not in self.visited_urls:
-                    links.append(absolute_url)
-            
-            return text, links
+            return self.parse_page(final_url, content)
         
         except Exception as e:
             print(f"Error scraping {url}: {e}")
             return None, []
     
-    def scrape_website(self):
-        """Scrape multiple pages from the website"""
-        to_visit = [self.base_url]
+    async def _scrape_async(self):
+        """Breadth-first crawl, fetching each frontier wave concurrently"""
+        to_visit = deque([self.base_url])
+        # queued and visited_urls hold normalized keys; the frontier keeps
+        # the original URLs, which are what gets fetched
+        queued = {self._normalize(self.base_url)}
         documents = []
+        semaphore = asyncio.Semaphore(self.max_concurrency)
         
+        # One pooled session so keep-alive connections are reused across pages
+        # instead of paying a fresh TCP+TLS handshake per request
+        connector = aiohttp.TCPConnector(limit_per_host=self.max_concurrency, keepalive_timeout=30)
+        async with aiohttp.ClientSession(
+            connector=connector,
+            headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'},
+            timeout=aiohttp.ClientTimeout(total=10)
+        ) as session:
+            while to_visit and len(self.visited_urls) < self.max_pages:
+                # Claim the next wave of unvisited URLs within the page budget
+                wave = []
+                while to_visit and len(self.visited_urls) < self.max_pages:
+                    url = to_visit.popleft()
+                    print(f"Scraping: {url} ({len(self.visited_urls) + 1}/{self.max_pages})")
+                    self.visited_urls.add(self._normalize(url))
+                    wave.append(url)
+                
+                results = await asyncio.gather(
+                    *(self.scrape_page(session, semaphore, url) for url in wave)
+                )
+                
+                for url, (text, links) in zip(wave, results):
+                    if text and len(text.strip()) > 100:
+                        content_hash = hashlib.sha256(text.encode()).hexdigest()
+                        self.page_hashes[url] = content_hash
+                        
+                        # Skip pages whose content is unchanged since the last build
+                        if self.known_hashes.get(url) != content_hash:
+                            documents.append({
+                                'content': text,
+                                'source': url
+                            })
+                    
+                    # Add new links to visit, enqueuing each URL at most once
+                    for link in links:
+                        key = self._normalize(link)
+                        if key not in queued:
+                            queued.add(key)
+                            to_visit.append(link)
+        
+        return documents
+    
+    def scrape_website(self):
+        """Scrape multiple pages from the website"""
         print(f"Starting to scrape {self.base_url}...")
         
-        while to_visit and len(self.visited_urls) < self.max_pages:
-            url = to_visit.pop(0)
-            
-            if url in self.visited_urls:
-                continue
-            
-            print(f"Scraping: {url} ({len(self.visited_urls) + 1}/{self.max_pages})")
-            self.visited_urls.add(url)
-            
-            text, links = self.scrape_page(url)
-            
-            if text and len(text.strip()) > 100:
-                documents.append({
-                    'content': text,
-                    'source': url
-                })
-            
-            # Add new links to visit
-            to_visit.extend([link for link in links if link not in self.visited_urls])
+        documents = asyncio.run(self._scrape_async())
         
-        print(f"\nScraped {len(documents)} pages successfully!")
+        print(f"\nScraped {len(self.page_hashes)} pages successfully ({len(documents)} new or changed)!")
         return documents
 
 class RAGSystem:
@@ -107,46 +447,142 @@ class RAGSystem:
     
     def __init__(self):
         print("Initializing embeddings model...")
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
+        self.embeddings = load_query_embeddings()
+        # Used directly for bulk, length-sorted batch encoding of chunks,
+        # always in float32. The query encoder's model is reused only when it
+        # is the PyTorch backend running in float32 as well.
+        if (isinstance(self.embeddings, SentenceTransformerEmbeddings)
+                and select_query_dtype() is torch.float32):
+            self.model = self.embeddings.model
+        else:
+            self.model = SentenceTransformer(EMBEDDING_MODEL_NAME, device=EMBEDDING_DEVICE)
+        # Token-based chunker using the model's own (Rust) tokenizer
+        self.chunker = chunkerify(EMBEDDING_MODEL_NAME, chunk_size=CHUNK_SIZE_TOKENS)
         self.vectorstore = None
         print("Embeddings model loaded!")
     
+    def split_documents(self, documents):
+        """Split documents into chunks with source metadata"""
+        processes = os.cpu_count() if len(documents) >= PARALLEL_CHUNKING_MIN_DOCS else 1
+        chunks_per_doc = self.chunker(
+            [doc['content'] for doc in documents],
+            processes=processes,
+            overlap=CHUNK_OVERLAP_TOKENS
+        )
+        
+        texts = [chunk for chunks in chunks_per_doc for chunk in chunks]
+        metadatas = [
+            {'source': doc['source']}
+            for doc, chunks in zip(documents, chunks_per_doc)
+            for _ in chunks
+        ]
+        
+        print(f"Created {len(texts)} text chunks")
+        return texts, metadatas
+    
+    def embed_texts(self, texts):
+        """Encode chunks into a single contiguous float32 embedding matrix"""
+        with torch.inference_mode():
+            vectors = self.model.encode(
+                texts,
+                batch_size=EMBEDDING_BATCH_SIZE,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=True
+            )
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+    
+    def build_and_save_vectorstore(self, texts, metadatas, vectors):
+        """Build the FAISS vectorstore from precomputed vectors and save it"""
+        index = build_faiss_index(vectors)
+        
+        ids = [str(uuid.uuid4()) for _ in texts]
+        docstore = InMemoryDocstore({
+            doc_id: Document(page_content=text, metadata=metadata)
+            for doc_id, text, metadata in zip(ids, texts, metadatas)
+        })
+        self.vectorstore = FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=dict(enumerate(ids))
+        )
+        
+        # Save to disk
+        print(f"Saving FAISS index to {FAISS_INDEX_PATH}...")
+        save_vectorstore(self.vectorstore, FAISS_INDEX_PATH)
+        # Keep the full-precision matrix so later updates never re-encode
+        # unchanged chunks or decode them from the compressed index
+        np.save(EMBEDDINGS_PATH, vectors)
+    
     def process_and_store_documents(self, documents):
         """Split documents and store in FAISS"""
         print("\nProcessing documents...")
+        texts, metadatas = self.split_documents(documents)
         
-        # Split documents into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len
-        )
+        # Create embeddings and build the FAISS index
+        print("Creating embeddings and storing in FAISS...")
+        vectors = self.embed_texts(texts)
+        self.build_and_save_vectorstore(texts, metadatas, vectors)
+        
+        print("Documents stored successfully!")
+    
+    def load_stored_vectors(self):
+        """Return the saved embedding matrix, memory-mapped from disk"""
+        index = self.vectorstore.index
+        if os.path.exists(EMBEDDINGS_PATH):
+            vectors = np.load(EMBEDDINGS_PATH, mmap_mode='r')
+            if vectors.shape[0] == index.ntotal:
+                return vectors
+        
+        # Indexes built before embeddings were saved: decode them instead
+        return reconstruct_vectors(index)
+    
+    def update_documents(self, documents, current_sources):
+        """Re-embed changed documents, keep unchanged pages and drop pages no longer on the site"""
+        if not self.vectorstore:
+            self.process_and_store_documents(documents)
+            return
+        
+        changed_sources = {doc['source'] for doc in documents}
         
+        # Keep the chunks of unchanged pages that were still found in this
+        # crawl, along with their stored vectors.
+        # Not every compressed index supports remove_ids, so the index is
+        # rebuilt from the stored vectors instead of deleted in place.
+        kept_positions = []
         texts = []
         metadatas = []
         
-        for doc in documents:
-            chunks = text_splitter.split_text(doc['content'])
-            texts.extend(chunks)
-            metadatas.extend([{'source': doc['source']} for _ in chunks])
+        for position, doc_id in sorted(self.vectorstore.index_to_docstore_id.items()):
+            doc = self.vectorstore.docstore.search(doc_id)
+            source = doc.metadata.get('source')
+            if source in current_sources and source not in changed_sources:
+                kept_positions.append(position)
+                texts.append(doc.page_content)
+                metadatas.append(doc.metadata)
         
-        print(f"Created {len(texts)} text chunks")
+        if not documents and len(kept_positions) == self.vectorstore.index.ntotal:
+            print("No page changes detected. Keeping the existing index.")
+            return
         
-        # Create FAISS vectorstore
-        print("Creating embeddings and storing in FAISS...")
-        self.vectorstore = FAISS.from_texts(
-            texts=texts,
-            embedding=self.embeddings,
-            metadatas=metadatas
-        )
+        print("\nUpdating changed documents...")
+        removed = self.vectorstore.index.ntotal - len(kept_positions)
+        print(f"Dropping {removed} chunks from changed or removed pages")
         
-        # Save to disk
-        print(f"Saving FAISS index to {FAISS_INDEX_PATH}...")
-        self.vectorstore.save_local(FAISS_INDEX_PATH)
+        old_vectors = self.load_stored_vectors()
+        vectors = np.array(old_vectors[kept_positions])
+        del old_vectors  # release the memory map before embeddings.npy is rewritten
         
-        print("Documents stored successfully!")
+        new_texts, new_metadatas = [], []
+        if documents:
+            new_texts, new_metadatas = self.split_documents(documents)
+            print(f"Re-embedding {len(new_texts)} chunks from {len(changed_sources)} changed pages...")
+            vectors = np.vstack([vectors, self.embed_texts(new_texts)])
+        
+        self.build_and_save_vectorstore(texts + new_texts, metadatas + new_metadatas, vectors)
+        
+        print("Documents updated successfully!")
     
     def load_existing_vectorstore(self):
         """Load existing FAISS vectorstore"""
@@ -154,11 +590,8 @@ class RAGSystem:
             raise FileNotFoundError(f"FAISS index not found at {FAISS_INDEX_PATH}")
         
         print(f"Loading existing FAISS index from {FAISS_INDEX_PATH}...")
-        self.vectorstore = FAISS.load_local(
-            FAISS_INDEX_PATH,
-            self.embeddings,
-            allow_dangerous_deserialization=True
-        )
+        # Read into memory: incremental updates may modify the loaded index
+        self.vectorstore = load_vectorstore(self.embeddings, FAISS_INDEX_PATH, mmap=False)
         print("FAISS index loaded successfully!")
     
     def retrieve_context(self, query, k=3):
@@ -200,12 +633,25 @@ def chatbot_with_rag():
         choice = input("FAISS index found. Do you want to re-scrape the website? (y/n): ").strip().lower()
         
         if choice == 'y':
+            # Load the existing index so only changed pages are re-embedded
+            try:
+                rag.load_existing_vectorstore()
+                known_hashes = load_page_hashes()
+            except Exception as e:
+                print(f"Error loading vectorstore: {e}")
+                print("Rebuilding the index from scratch.")
+                known_hashes = {}
+            
             # Scrape website
-            scraper = WebsiteScraper(WEBSITE_URL, max_pages=MAX_PAGES_TO_SCRAPE)
+            scraper = WebsiteScraper(WEBSITE_URL, max_pages=MAX_PAGES_TO_SCRAPE, known_hashes=known_hashes)
             documents = scraper.scrape_website()
             
-            if documents:
-                rag.process_and_store_documents(documents)
+            if scraper.page_hashes:
+                # Pages missing from this crawl are dropped, as in a full rebuild
+                rag.update_documents(documents, set(scraper.page_hashes))
+                save_page_hashes(scraper.page_hashes)
+            elif rag.vectorstore:
+                print("No pages scraped. Keeping the existing index.")
             else:
                 print("No documents scraped. Exiting...")
                 return
@@ -225,6 +671,7 @@ def chatbot_with_rag():
         
         if documents:
             rag.process_and_store_documents(documents)
+            save_page_hashes(scraper.page_hashes)
         else:
             print("No documents scraped. Exiting...")
             return
@@ -5,21 +5,51 @@ Connects the React frontend with the LangChain RAG system
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
+from collections import OrderedDict, deque
 import os
+import json
+import asyncio
+import hashlib
+import threading
+import torch
+import numpy as np
 from dotenv import load_dotenv
 
 from langchain_groq import ChatGroq
 from langchain.schema import HumanMessage, AIMessage, SystemMessage
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
+
+from chatbot import INFERENCE_THREADS, load_query_embeddings, load_vectorstore
 
 load_dotenv()
 
+# Inference-only server: use this worker's share of the cores for PyTorch
+# and disable autograd.
+# Grad mode is per thread, so this only covers the main thread; query
+# encoding in worker threads runs under torch.inference_mode() instead.
+torch.set_num_threads(INFERENCE_THREADS)
+torch.set_grad_enabled(False)
+
 # Configuration
 FAISS_INDEX_PATH = "faiss_index"
+QUERY_CACHE_SIZE = 4096
+MAX_SESSIONS = 10000
+EMBED_BATCH_WINDOW = 0.02  # seconds to wait for more queries to join a batch
+EMBED_MAX_BATCH_SIZE = 32
+
+# System prompt pieces; only the retrieved context varies per request
+PROMPT_HEAD = """You are AgiAI, a helpful and friendly AI assistant for Agiteks. 
+Use the following context from the Agiteks website to answer the user's question accurately.
+If the answer is not in the context, say so politely and provide a general helpful response.
+
+Context from Agiteks website:
+"""
+PROMPT_TAIL = """
+
+Be concise, friendly, professional, and accurate in your responses."""
 
 # Initialize FastAPI app
 app = FastAPI(title="AgiAI RAG Chatbot API", version="1.0.0")
@@ -34,34 +64,153 @@ app.add_middleware(
 )
 
 # Pydantic models for request/response
-class Message(BaseModel):
-    content: str
-    role: str  # 'user' or 'bot'
-
 class ChatRequest(BaseModel):
     content: str
     role: str = "user"
-    conversation_history: Optional[List[Message]] = None
+    session_id: str
 
 class ChatResponse(BaseModel):
     content: str
     role: str = "bot"
     sources: Optional[List[str]] = None
 
+class LRUCache:
+    """Thread-safe least-recently-used cache"""
+    
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+    
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def pop(self, key):
+        with self._lock:
+            return self._data.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
 # Global variables for RAG system
 rag_system = None
 llm = None
-conversation_histories = {}  # Store conversation histories per session
+# Store the last 3 exchanges per session server-side; the least recently
+# active sessions are evicted once MAX_SESSIONS is reached
+conversation_histories = LRUCache(MAX_SESSIONS)
+
+class QueryBatcher:
+    """Coalesces concurrent query embeddings into a single encoder call"""
+    
+    def __init__(self, embeddings, max_batch_size=EMBED_MAX_BATCH_SIZE, window=EMBED_BATCH_WINDOW):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.window = window
+        self.queue = asyncio.Queue()
+        self.task = None
+        self._batch = []  # queries taken off the queue but not yet answered
+    
+    def start(self):
+        """Start the background batching task on the running event loop"""
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Cancel the batching task and every query still waiting on it"""
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+        
+        # Fail the queries that never reached the encoder
+        while not self.queue.empty():
+            _, future = self.queue.get_nowait()
+            future.cancel()
+    
+    async def embed(self, text):
+        """Queue a query and wait for its embedding"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((text, future))
+        return await future
+    
+    async def _next_batch(self):
+        """Wait for one query, then collect more until the window closes or the batch is full"""
+        loop = asyncio.get_running_loop()
+        batch = self._batch = [await self.queue.get()]
+        deadline = loop.time() + self.window
+        
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        
+        return batch
+    
+    def _embed_batch(self, texts):
+        """Encode a batch in the calling (worker) thread without autograd"""
+        # Grad mode is thread-local, so it must be set inside the worker thread
+        with torch.inference_mode():
+            return self.embeddings.embed_documents(texts)
+    
+    async def _run(self):
+        try:
+            while True:
+                batch = await self._next_batch()
+                texts = [text for text, _ in batch]
+                
+                try:
+                    # One forward pass for the whole batch, off the event loop
+                    vectors = await asyncio.to_thread(self._embed_batch, texts)
+                except Exception as e:
+                    print(f"Error embedding query batch: {e}")
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                
+                for (_, future), vector in zip(batch, vectors):
+                    # Skip requests that were cancelled while waiting
+                    if not future.done():
+                        future.set_result(vector)
+                self._batch = []
+        except asyncio.CancelledError:
+            # Cancel the queries of the batch in progress on shutdown
+            for _, future in self._batch:
+                future.cancel()
+            self._batch = []
+            raise
 
 class RAGSystem:
     """RAG system with FAISS vector database"""
     
     def __init__(self):
         print("Initializing embeddings model...")
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
+        self.embeddings = load_query_embeddings()
         self.vectorstore = None
+        # Keyed by SHA1 of the normalized query
+        self.embedding_cache = LRUCache(QUERY_CACHE_SIZE)
+        self.retrieval_cache = LRUCache(QUERY_CACHE_SIZE)
+        self.query_batcher = QueryBatcher(self.embeddings)
         print("Embeddings model loaded!")
     
     def load_existing_vectorstore(self):
@@ -70,19 +219,41 @@ class RAGSystem:
             raise FileNotFoundError(f"FAISS index not found at {FAISS_INDEX_PATH}")
         
         print(f"Loading existing FAISS index from {FAISS_INDEX_PATH}...")
-        self.vectorstore = FAISS.load_local(
-            FAISS_INDEX_PATH,
-            self.embeddings,
-            allow_dangerous_deserialization=True
-        )
+        # Documents (and IVF index lists) are memory-mapped and shared between
+        # workers; the default HNSW-SQ index is loaded into each worker's memory
+        self.vectorstore = load_vectorstore(self.embeddings, FAISS_INDEX_PATH)
+        self.retrieval_cache.clear()
         print("FAISS index loaded successfully!")
     
-    def retrieve_context(self, query, k=3):
+    def warm_up(self):
+        """Run one embedding and search so the first request avoids cold-start costs"""
+        print("Warming up embeddings model and FAISS index...")
+        self.embeddings.embed_query("warmup")
+        self.vectorstore.similarity_search("warmup", k=3)
+        print("Warm-up complete!")
+    
+    async def retrieve_context(self, query, k=3):
         """Retrieve relevant context for a query"""
         if not self.vectorstore:
             return "", []
         
-        docs = self.vectorstore.similarity_search(query, k=k)
+        normalized_query = query.strip().lower()
+        query_hash = hashlib.sha1(normalized_query.encode()).hexdigest()
+        
+        cached = self.retrieval_cache.get((query_hash, k))
+        if cached is not None:
+            context, sources = cached
+            return context, list(sources)
+        
+        # The embedding is cached separately so it is reused across values of k
+        embedding = self.embedding_cache.get(query_hash)
+        if embedding is None:
+            # Upcast to float32 to match the index (the encoder may run in fp16/bf16)
+            embedding = np.asarray(await self.query_batcher.embed(normalized_query), dtype=np.float32)
+            self.embedding_cache.put(query_hash, embedding)
+        
+        # FAISS search is CPU-bound, so keep it off the event loop
+        docs = await asyncio.to_thread(self.vectorstore.similarity_search_by_vector, embedding, k)
         
         # Format context with sources
         context_parts = []
@@ -94,6 +265,7 @@ class RAGSystem:
             context_parts.append(f"[Source {i}: {source}]\n{doc.page_content}")
         
         context = "\n\n".join(context_parts)
+        self.retrieval_cache.put((query_hash, k), (context, tuple(sources)))
         return context, sources
 
 @app.on_event("startup")
@@ -119,10 +291,18 @@ async def startup_event():
     
     try:
         rag_system.load_existing_vectorstore()
+        rag_system.warm_up()
+        rag_system.query_batcher.start()
     except FileNotFoundError as e:
         print(f"Warning: {e}")
         print("Please run the scraper script first to create the FAISS index.")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the query batching task so pending requests are cancelled cleanly"""
+    if rag_system:
+        await rag_system.query_batcher.stop()
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -132,11 +312,8 @@ async def root():
         "rag_loaded": rag_system is not None and rag_system.vectorstore is not None
     }
 
-@app.post("/getMsg", response_model=ChatResponse)
-async def get_message(request: ChatRequest):
-    """
-    Main endpoint to process user messages and return bot responses
-    """
+def ensure_services_ready():
+    """Raise a 503 if the RAG system or LLM is not available"""
     if not rag_system or not rag_system.vectorstore:
         raise HTTPException(
             status_code=503,
@@ -148,6 +325,39 @@ async def get_message(request: ChatRequest):
             status_code=503,
             detail="LLM not initialized. Please check GROQ_API_KEY."
         )
+
+def build_messages(request, user_message, context):
+    """Build the LLM message list from the retrieved context and history"""
+    # Create system prompt with context
+    system_prompt = PROMPT_HEAD + context + PROMPT_TAIL
+    
+    # Build messages for the LLM
+    messages = [SystemMessage(content=system_prompt)]
+    
+    # Add this session's recent conversation history
+    history = conversation_histories.get(request.session_id)
+    if history:
+        messages.extend(history)
+    
+    # Add current user message
+    messages.append(HumanMessage(content=user_message))
+    return messages
+
+def record_exchange(session_id, user_message, bot_message):
+    """Append an exchange to the session's bounded history"""
+    history = conversation_histories.get(session_id)
+    if history is None:
+        history = deque(maxlen=6)
+        conversation_histories.put(session_id, history)
+    history.append(HumanMessage(content=user_message))
+    history.append(AIMessage(content=bot_message))
+
+@app.post("/getMsg", response_model=ChatResponse)
+async def get_message(request: ChatRequest):
+    """
+    Main endpoint to process user messages and return bot responses
+    """
+    ensure_services_ready()
     
     try:
         user_message = request.content.strip()
@@ -156,35 +366,12 @@ async def get_message(request: ChatRequest):
             raise HTTPException(status_code=400, detail="Message content cannot be empty")
         
         # Retrieve relevant context from RAG
-        context, sources = rag_system.retrieve_context(user_message, k=3)
-        
-        # Create system prompt with context
-        system_prompt = f"""You are AgiAI, a helpful and friendly AI assistant for Agiteks. 
-Use the following context from the Agiteks website to answer the user's question accurately.
-If the answer is not in the context, say so politely and provide a general helpful response.
-
-Context from Agiteks website:
-{context}
-
-Be concise, friendly, professional, and accurate in your responses."""
-        
-        # Build messages for the LLM
-        messages = [SystemMessage(content=system_prompt)]
-        
-        # Add conversation history if provided (last 6 messages)
-        if request.conversation_history:
-            recent_history = request.conversation_history[-6:]
-            for msg in recent_history:
-                if msg.role == "user":
-                    messages.append(HumanMessage(content=msg.content))
-                elif msg.role == "bot":
-                    messages.append(AIMessage(content=msg.content))
-        
-        # Add current user message
-        messages.append(HumanMessage(content=user_message))
+        context, sources = await rag_system.retrieve_context(user_message, k=3)
+        messages = build_messages(request, user_message, context)
         
         # Get response from LLM
-        response = llm.invoke(messages)
+        response = await llm.ainvoke(messages)
+        record_exchange(request.session_id, user_message, response.content)
         
         # Return response
         return ChatResponse(
@@ -200,11 +387,54 @@ Be concise, friendly, professional, and accurate in your responses."""
             detail=f"Error processing your message: {str(e)}"
         )
 
+@app.post("/getMsg/stream")
+async def stream_message(request: ChatRequest):
+    """
+    Streaming variant of /getMsg that sends the response as server-sent events.
+    The first event carries the sources, then one event per content chunk,
+    terminated by [DONE].
+    """
+    ensure_services_ready()
+    
+    user_message = request.content.strip()
+    
+    if not user_message:
+        raise HTTPException(status_code=400, detail="Message content cannot be empty")
+    
+    try:
+        # Retrieve relevant context from RAG
+        context, sources = await rag_system.retrieve_context(user_message, k=3)
+        messages = build_messages(request, user_message, context)
+    except Exception as e:
+        print(f"Error processing message: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing your message: {str(e)}"
+        )
+    
+    async def event_stream():
+        yield f"data: {json.dumps({'sources': sources})}\n\n"
+        try:
+            response_parts = []
+            async for chunk in llm.astream(messages):
+                if chunk.content:
+                    response_parts.append(chunk.content)
+                    yield f"data: {json.dumps({'content': chunk.content})}\n\n"
+            record_exchange(request.session_id, user_message, "".join(response_parts))
+        except Exception as e:
+            print(f"Error streaming message: {e}")
+            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+        yield "data: [DONE]\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
 @app.post("/reset")
-async def reset_conversation():
-    """Reset conversation history"""
-    global conversation_histories
-    conversation_histories = {}
+async def reset_conversation(session_id: Optional[str] = None):
+    """Reset conversation history for one session, or for all sessions"""
+    if session_id:
+        conversation_histories.pop(session_id)
+    else:
+        conversation_histories.clear()
     return {"status": "success", "message": "Conversation history cleared"}
 
 @app.get("/health")
@@ -224,10 +454,17 @@ async def health_check():
 if __name__ == "__main__":
     import uvicorn
     
-    # Run the server
+    # Run the server; "auto" picks uvloop and httptools when they are
+    # installed (uvicorn[standard]) and falls back to asyncio/h11 where
+    # they are not, e.g. uvloop on Windows. Conversation
+    # histories live in process memory, so keep a single worker until they
+    # move to a shared store; WEB_CONCURRENCY can raise it once they do.
     uvicorn.run(
         "main:app",  # Assuming this file is named main.py
         host="0.0.0.0",
         port=8000,
-        reload=True  # Enable auto-reload during development
+        loop="auto",
+        http="auto",
+        workers=int(os.getenv("WEB_CONCURRENCY", 1)),
+        reload=False
     )
\ No newline at end of file